@@ -1,8 +1,9 @@
 # bot.py
+import asyncio
+import functools
 import logging
-import json
-import os
-from dotenv import load_dotenv
+import re
+import orjson
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
@@ -10,82 +11,129 @@ from telegram.ext import (
     CallbackQueryHandler, ContextTypes, filters
 )
 from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from config import (
-    TELEGRAM_TOKEN, ADMIN_IDS, PAYMENT_QR_FILE, PAYMENT_UPI_ID,
-    DB_PATH, TOL_MM
+    TELEGRAM_TOKEN, OPENAI_API_KEY, ADMIN_IDS, ADMIN_IDS_TUPLE, PAYMENT_QR_FILE,
+    PAYMENT_UPI_ID, TOL_MM, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT
 )
 from services import (
     init_db, get_phone, check_compat, find_compatible_glasses, normalize_glass,
     list_devices_by_brand, update_phone_dimensions, get_plans, add_payment,
     get_payment, list_payments, update_payment_status, check_batch_compatibility,
     find_devices_by_dimensions, add_device_suggestion, format_compatible_devices,
-    get_user_subscription_status, add_phone, device_exists,
-    get_subscription_details, increment_query_count, check_query_limit,
+    add_phone, device_exists, get_subscription_details,
+    get_user_quota, touch_user,
     add_compatible_devices, get_compatible_devices, update_device_from_source,
-    escape_markdown_v2
+    existing_devices, list_pending_suggestions, review_device_suggestion,
+    review_all_suggestions, escape_markdown_v2
 )
 from openai import AsyncOpenAI
+from cachetools import LRUCache
+import httpx
+
+try:
+    import uvloop
+except ImportError:  # uvloop is unavailable on Windows
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 
-# System prompt for Open AI
+QUERY_LIMIT_MESSAGE = (
+    "❌ You've reached the daily query limit of 10 for the free plan.\n"
+    "Upgrade to the Pro plan for unlimited queries and access to verified compatible devices!"
+)
+
+# Conversation state lives in user_data["flow"] as a (step, *args) tuple
+FLOW_IDLE = ()
+AWAITING_PAYMENT = "awaiting_payment_screenshot"
+
+# Pre-escaped MarkdownV2 notes appended to compatibility results
+NOTE_FREE = "⚠️ *Note*: " + escape_markdown_v2(
+    "Dimensions-based precision may vary. "
+    "Pro plan users get access to a verified compatible devices list for higher accuracy"
+)
+NOTE_PRO = (
+    "✅ *Verified* " + escape_markdown_v2("devices are admin-confirmed with exact matches. ") +
+    "*" + escape_markdown_v2("Dimension-based") + "* " +
+    escape_markdown_v2(f"results use ±{TOL_MM}mm tolerance and may vary")
+)
+NOTE_NO_MATCHES = "⚠️ *Note*: " + escape_markdown_v2(
+    "Verified devices are admin-confirmed with exact matches. "
+    f"Dimension-based results use ±{TOL_MM}mm tolerance and may vary"
+)
+# Pre-escaped greeting; fast_route sends every "hi"/"start" here
+WELCOME_MESSAGE = escape_markdown_v2(
+    "👋 Welcome! I'm an AI-powered bot that helps you check device compatibility and manage subscriptions. "
+    "Just tell me what you want in natural language, like:\n"
+    "- 'Check if Samsung Galaxy S21 fits iPhone 13'\n"
+    "- 'List compatible devices for Galaxy S21'\n"
+    "- 'Buy a Pro plan'\n"
+    "Admins can manage devices with commands like 'Add device Samsung Galaxy S25' or 'Fetch device Samsung Galaxy S25'.\n"
+    "You're on the Free Plan by default (10 queries/day). Use natural language, and I'll understand!"
+)
+
+# Memoized escaping for brand/model/status strings that recur across admin views
+_emd = functools.lru_cache(maxsize=8192)(escape_markdown_v2)
+
+# Upper bound on Telegram sends in flight for one multi-message reply
+SEND_CONCURRENCY = 25
+
+# Result tables longer than this are formatted off the event loop
+FORMAT_OFFLOAD_ROWS = 50
+
+# Shared Open AI client so keep-alive connections are reused across messages
+OPENAI_CLIENT = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        http2=True
+    )
+)
+
+# Parsed (intent, parameters, response) keyed on the stripped user message; casing
+# is kept so extracted brand/model parameters match what the user typed
+_INTENT_CACHE = LRUCache(maxsize=4096)
+
+INTENTS = (
+    "check_compatibility", "list_compatible", "find_by_dimensions", "batch_compatibility",
+    "suggest_device", "buy_subscription", "view_subscription", "view_compatible_devices",
+    "list_devices", "add_device", "edit_device", "add_compatible_devices",
+    "review_suggestions", "fetch_device", "cancel", "unknown"
+)
+
+# Function schema the model must call; guarantees parseable arguments
+ROUTE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "route",
+        "description": "Route the user's message to a bot intent",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "intent": {"type": "string", "enum": list(INTENTS)},
+                "parameters": {"type": "object"},
+                "response": {
+                    "type": "string",
+                    "description": "Reply to the user, only when intent is unknown"
+                }
+            },
+            "required": ["intent"]
+        }
+    }
+}
+
+# System prompt for Open AI; intent names are enforced by ROUTE_TOOL
 SYSTEM_PROMPT = """
-You are a Telegram bot assistant that helps users and admins manage device compatibility and subscriptions. Interpret the user's message in any language and identify the intent and parameters. Respond with a JSON object containing:
-- "intent": One of "check_compatibility", "list_compatible", "find_by_dimensions", "batch_compatibility", "suggest_device", "buy_subscription", "view_subscription", "view_compatible_devices", "list_devices", "add_device", "edit_device", "add_compatible_devices", "review_suggestions", "fetch_device", "cancel", or "unknown".
-- "parameters": A dictionary of relevant parameters (e.g., device models, dimensions).
-- "response": A natural language response to send to the user (optional, for direct replies).
-
-Available intents and parameters:
-1. check_compatibility: Check if two devices are compatible.
-   - Parameters: model1 (str), model2 (str), htol (float, optional), wtol (float, optional), dtol (float, optional).
-   - Example: "Check if Samsung Galaxy S21 guard fits iPhone 13, htol=2, wtol=2, dtol=0.1"
-2. list_compatible: List devices compatible with a given model based on dimensions and verified data.
-   - Parameters: model (str).
-   - Example: "List devices compatible with Galaxy S21"
-3. find_by_dimensions: Find devices by dimension ranges (requires Pro plan).
-   - Parameters: height_min (float), height_max (float), width_min (float), width_max (float), diagonal_min (float), diagonal_max (float).
-   - Example: "Find devices with height 150-155, width 70-75, diagonal 6.0-6.2"
-4. batch_compatibility: Check compatibility for multiple devices (requires Pro plan).
-   - Parameters: devices (list of str).
-   - Example: "Check compatibility for Samsung Galaxy S21, iPhone 13, Pixel 6"
-5. suggest_device: Suggest a new device for review.
-   - Parameters: brand (str), model (str), height_mm (float), width_mm (float), diagonal_in (float), notch_type (str).
-   - Example: "Suggest Samsung Galaxy S21, 150.0 mm height, 70.0 mm width, 6.1 in diagonal, Punch-hole notch"
-6. buy_subscription: Initiate subscription purchase.
-   - Parameters: plan_id (str, optional).
-   - Example: "Buy a Pro plan"
-7. view_subscription: View user's subscription details (plan and validity period).
-   - Parameters: none.
-   - Example: "Show my subscription details"
-8. view_compatible_devices: View verified and dimension-based compatible devices for a model (requires Pro plan).
-   - Parameters: model (str).
-   - Example: "Show verified compatible devices for Galaxy S21"
-9. list_devices: List devices for a brand (admin only).
-   - Parameters: brand (str).
-   - Example: "List Samsung devices"
-10. add_device: Add a new device directly to the glasses table (admin only).
-    - Parameters: brand (str), model (str), height_mm (float), width_mm (float), diagonal_in (float), notch_type (str).
-    - Example: "Add Samsung Galaxy S21, 150.0 mm height, 70.0 mm width, 6.1 in diagonal, Punch-hole notch"
-11. edit_device: Edit a device’s dimensions and notch type (admin only).
-    - Parameters: brand (str), model (str), height_mm (float), width_mm (float), diagonal_in (float), notch_type (str).
-    - Example: "Edit Samsung Galaxy S21 to 151.0 mm height, 71.0 mm width, 6.2 in diagonal, Waterdrop notch"
-12. add_compatible_devices: Add verified compatible devices for a model (admin only).
-    - Parameters: brand (str), model (str), compatible_devices (list of [brand, model] pairs).
-    - Example: "Add compatible devices for Samsung Galaxy S21: Samsung Galaxy S20, iPhone 12"
-13. review_suggestions: Review pending device suggestions (admin only).
-    - Parameters: none.
-    - Example: "Review device suggestions"
-14. fetch_device: Fetch a device’s specs from GSMArena and add/update it (admin only).
-    - Parameters: brand (str), model (str).
-    - Example: "Fetch device Samsung Galaxy S25"
-15. cancel: Cancel the current action (e.g., payment process).
-    - Parameters: none.
-    - Example: "Cancel"
-16. unknown: For unrecognized intents.
-    - Parameters: none.
-    - Example: "Hello, how are you?"
-
-Free plan users are limited to 10 queries per day; Pro plan users have unlimited queries and access to verified compatible devices. For multi-step processes (e.g., buy_subscription requiring a screenshot), indicate the next step in the response and maintain context. Admin users can use natural language for admin-specific intents (list_devices, add_device, edit_device, add_compatible_devices, review_suggestions, fetch_device).
+You route messages (any language) for a Telegram bot that checks screen guard compatibility between devices and sells subscriptions. Call route with the intent and its parameters; set "response" only for unknown.
+Device names (model, model1, model2, devices) include the brand. Dimensions are floats in mm, diagonals in inches.
+- check_compatibility: model1 (guard), model2, htol?, wtol?, dtol?
+- list_compatible: model | view_compatible_devices: model (verified list requested)
+- find_by_dimensions: height_min, height_max, width_min, width_max, diagonal_min, diagonal_max
+- batch_compatibility: devices (list)
+- suggest_device, add_device, edit_device: brand, model, height_mm, width_mm, diagonal_in, notch_type
+- add_compatible_devices: brand, model, compatible_devices (list of [brand, model])
+- list_devices: brand | fetch_device: brand, model | buy_subscription: plan_id?
+- view_subscription, review_suggestions, cancel, unknown: no parameters
 """
 
 async def send_markdown_v2(update, text, reply_markup=None):
@@ -103,17 +151,33 @@ async def send_markdown_v2(update, text, reply_markup=None):
             reply_markup=reply_markup
         )
 
+async def gather_bounded(coros, limit=SEND_CONCURRENCY):
+    # Overlap Telegram sends while staying well under the bot-wide rate limit
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+async def send_to_admins(send):
+    # Fan out concurrently; a failing admin chat must not hold up the others
+    results = await asyncio.gather(
+        *(send(admin_id) for admin_id in ADMIN_IDS_TUPLE),
+        return_exceptions=True
+    )
+    for admin_id, result in zip(ADMIN_IDS_TUPLE, results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to notify admin {admin_id}: {result}")
+
 async def notify_admins(context, error_message, user_id=None):
     message = f"🚨 *Error Notification*\nUser ID: {user_id or 'Unknown'}\nError: {escape_markdown_v2(str(error_message))}"
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
-        except Exception as e:
-            logging.error(f"Failed to notify admin {admin_id}: {e}")
+    await send_to_admins(lambda admin_id: context.bot.send_message(
+        chat_id=admin_id,
+        text=message,
+        parse_mode=ParseMode.MARKDOWN_V2
+    ))
 
 async def error_handler(update, context):
     user_id = update.effective_user.id if update.effective_user else None
@@ -125,55 +189,119 @@ async def error_handler(update, context):
         parse_mode=ParseMode.MARKDOWN_V2
     )
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    message = (
-        "👋 Welcome! I'm an AI-powered bot that helps you check device compatibility and manage subscriptions. "
-        "Just tell me what you want in natural language, like:\n"
-        "- 'Check if Samsung Galaxy S21 fits iPhone 13'\n"
-        "- 'List compatible devices for Galaxy S21'\n"
-        "- 'Buy a Pro plan'\n"
-        "Admins can manage devices with commands like 'Add device Samsung Galaxy S25' or 'Fetch device Samsung Galaxy S25'.\n"
-        "You're on the Free Plan by default (10 queries/day). Use natural language, and I'll understand!"
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, params=None):
+    await send_markdown_v2(update, WELCOME_MESSAGE)
+
+# Inline button callback data: approve_<payment id> and approve_sug_<suggestion id>
+# Single pattern for both kinds of review button; review_callback picks the handler
+REVIEW_CALLBACK_RE = re.compile(r"^(?:approve|reject)(?:_sug)?_\d+$")
+BULK_SUGGESTION_CALLBACK_RE = re.compile(r"^bulk_(approve|reject)_sug_\d+$")
+
+APPROVE_LABEL, REJECT_LABEL = "✅ Approve", "❌ Reject"
+
+def bulk_review_keyboard(max_rid):
+    # Bulk decisions only cover suggestions up to the highest id the admin was shown
+    return InlineKeyboardMarkup(((
+        InlineKeyboardButton(f"{APPROVE_LABEL} all", callback_data=f"bulk_approve_sug_{max_rid}"),
+        InlineKeyboardButton(f"{REJECT_LABEL} all", callback_data=f"bulk_reject_sug_{max_rid}"),
+    ),))
+
+def review_keyboard(suffix):
+    # Approve/reject row whose callback data matches REVIEW_CALLBACK_RE
+    return InlineKeyboardMarkup(((
+        InlineKeyboardButton(APPROVE_LABEL, callback_data=f"approve_{suffix}"),
+        InlineKeyboardButton(REJECT_LABEL, callback_data=f"reject_{suffix}"),
+    ),))
+
+# Trivial messages routed locally instead of through Open AI
+_CANCEL_RE = re.compile(r"^(?:cancel|stop|exit)[.!]*$", re.I)
+_GREETING_RE = re.compile(r"^(?:hi|hello|hey|start)[.!]*$", re.I)
+_BUY_RE = re.compile(r"^buy\s+(?:(?:a|the)\s+)?(?:plan\s*(\d+)|plan|(\w+)(?:\s+plan)?)$", re.I)
+_LIST_DEVICES_RE = re.compile(r"^list\s+(?!compatible\b|verified\b)(\w+)\s+devices$", re.I)
+
+def fast_route(user_message):
+    if _CANCEL_RE.match(user_message):
+        return "cancel", {}, ""
+    if _GREETING_RE.match(user_message):
+        return "start", {}, ""
+    match = _BUY_RE.match(user_message)
+    if match:
+        number, plan_id = match.groups()
+        if number:
+            return "buy_subscription", {"plan_id": number}, ""
+        if not plan_id:
+            return "buy_subscription", {}, ""
+        if plan_id.lower() in get_plan_catalog()[1]:
+            return "buy_subscription", {"plan_id": plan_id}, ""
+        return None
+    match = _LIST_DEVICES_RE.match(user_message)
+    if match:
+        return "list_devices", {"brand": match.group(1)}, ""
+    return None
+
+async def parse_intent(user_message):
+    routed = fast_route(user_message)
+    if routed is not None:
+        logging.info(f"Fast-routed message to intent {routed[0]}")
+        return routed
+
+    key = user_message.strip()
+    cached = _INTENT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    response = await OPENAI_CLIENT.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ],
+        tools=[ROUTE_TOOL],
+        tool_choice={"type": "function", "function": {"name": "route"}}
     )
-    await send_markdown_v2(update, message)
+    result = orjson.loads(response.choices[0].message.tool_calls[0].function.arguments)
+    parsed = (
+        result.get("intent", "unknown"),
+        result.get("parameters", {}),
+        result.get("response", "")
+    )
+    _INTENT_CACHE[key] = parsed
+    return parsed
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     user_message = update.message.text.strip()
 
     # Handle payment screenshot state
-    if context.user_data.get("state") == "awaiting_payment_screenshot":
+    if context.user_data.get("flow", FLOW_IDLE)[:1] == (AWAITING_PAYMENT,):
         if user_message.lower() in ["cancel", "stop", "exit", "/cancel"]:
-            context.user_data.pop("state", None)
-            context.user_data.pop("buy_plan_id", None)
+            context.user_data.pop("flow", None)
             await send_markdown_v2(update, "✅ Payment process cancelled")
             return
         await send_markdown_v2(update, "❌ Please send a photo screenshot of your payment or type /cancel to exit")
         return
 
+    # Admins get Pro access; everyone else's plan is read once per message
+    is_admin = user_id in ADMIN_IDS
+    plan_id = "pro" if is_admin else "free"
+
+    # Process text input with Open AI, overlapping the quota lookup below
+    intent_task = asyncio.create_task(parse_intent(user_message))
+
     # Check query limit for non-pro users (excluding admins)
-    if user_id not in ADMIN_IDS and get_user_subscription_status(user_id) != "pro":
-        query_count = check_query_limit(user_id)
-        if query_count >= 10:
-            message = (
-                "❌ You've reached the daily query limit of 10 for the free plan.\n"
-                "Upgrade to the Pro plan for unlimited queries and access to verified compatible devices!"
-            )
-            await send_markdown_v2(update, message)
+    if not is_admin:
+        try:
+            plan_id, query_count = await asyncio.to_thread(get_user_quota, user_id)
+        except Exception:
+            intent_task.cancel()
+            raise
+        if plan_id != "pro" and query_count >= 10:
+            intent_task.cancel()
+            await send_markdown_v2(update, QUERY_LIMIT_MESSAGE)
             return
 
-    # Process text input with Open AI
     try:
-        openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ],
-            response_format={"type": "json_object"}
-        )
-        result = json.loads(response.choices[0].message.content)
+        intent, parameters, response_text = await intent_task
     except Exception as e:
         error_message = f"Open AI API error: {e}"
         logging.error(error_message)
@@ -181,63 +309,34 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await send_markdown_v2(update, "Sorry, I couldn't process your request. Please try again.")
         return
 
-    intent = result.get("intent", "unknown")
-    parameters = result.get("parameters", {})
-    response_text = result.get("response", "")
-
     # Increment query count for relevant intents (non-admins only)
-    if user_id not in ADMIN_IDS and intent in [
-        "check_compatibility", "list_compatible", "find_by_dimensions",
-        "batch_compatibility", "view_compatible_devices"
-    ]:
-        increment_query_count(user_id)
+    if not is_admin and intent in BILLABLE_INTENTS:
+        plan_id, query_count = await asyncio.to_thread(touch_user, user_id)
+        if plan_id != "pro" and query_count > 10:
+            await send_markdown_v2(update, QUERY_LIMIT_MESSAGE)
+            return
 
     # Handle intents
-    if intent == "check_compatibility":
-        await handle_check_compatibility(update, context, parameters)
-    elif intent in ["list_compatible", "view_compatible_devices"]:
-        await handle_list_compatible(update, context, parameters)
-    elif intent == "find_by_dimensions":
-        if user_id not in ADMIN_IDS and get_user_subscription_status(user_id) != "pro":
-            await send_markdown_v2(update, "⚠️ This feature requires a Pro plan")
-            return
-        await handle_find_by_dimensions(update, context, parameters)
-    elif intent == "batch_compatibility":
-        if user_id not in ADMIN_IDS and get_user_subscription_status(user_id) != "pro":
-            await send_markdown_v2(update, "⚠️ This feature requires a Pro plan")
-            return
-        await handle_batch_compatibility(update, context, parameters)
-    elif intent == "suggest_device":
-        await handle_suggest_device(update, context, parameters)
-    elif intent == "buy_subscription":
-        await handle_buy_subscription(update, context, parameters)
-    elif intent == "view_subscription":
-        await handle_view_subscription(update, context)
-    elif intent in ["list_devices", "add_device", "edit_device", "add_compatible_devices", "review_suggestions", "fetch_device"]:
-        if user_id not in ADMIN_IDS:
-            await send_markdown_v2(update, "❌ Unauthorized")
-            return
-        if intent == "list_devices":
-            await handle_list_devices(update, context, parameters)
-        elif intent == "add_device":
-            await handle_add_device(update, context, parameters)
-        elif intent == "edit_device":
-            await handle_edit_device(update, context, parameters)
-        elif intent == "add_compatible_devices":
-            await handle_add_compatible_devices(update, context, parameters)
-        elif intent == "review_suggestions":
-            await handle_review_suggestions(update, context)
-        elif intent == "fetch_device":
-            await handle_fetch_device(update, context, parameters)
-    elif intent == "cancel":
-        await cancel(update, context)
-    else:
+    handler = INTENT_HANDLERS.get(intent)
+    if handler is None:
         message = escape_markdown_v2(response_text) or "❓ I didn't understand your request. Try a command like 'Check if Samsung Galaxy S21 fits iPhone 13'."
         await send_markdown_v2(update, message)
+        return
+    if intent in ADMIN_INTENTS and not is_admin:
+        await send_markdown_v2(update, "❌ Unauthorized")
+        return
+    if intent in PRO_INTENTS and plan_id != "pro":
+        await send_markdown_v2(update, "⚠️ This feature requires a Pro plan")
+        return
+    # Plan-aware handlers get the plan resolved above instead of querying it again
+    if intent in PLAN_INTENTS:
+        await handler(update, context, parameters, plan_id=plan_id)
+    else:
+        await handler(update, context, parameters)
 
 async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if context.user_data.get("state") == "awaiting_payment_screenshot":
+    if context.user_data.get("flow", FLOW_IDLE)[:1] == (AWAITING_PAYMENT,):
         photos = update.message.photo
         if not photos:
             await send_markdown_v2(update, "❌ Please send a valid photo screenshot of your payment")
@@ -246,6 +345,12 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await send_markdown_v2(update, "❓ I didn't expect a photo. Please type a command like 'Buy a Pro plan'.")
 
+async def format_devices(devices):
+    # Large tables are formatted on a worker thread so other chats aren't stalled
+    if len(devices) > FORMAT_OFFLOAD_ROWS:
+        return await asyncio.to_thread(format_compatible_devices, devices)
+    return format_compatible_devices(devices)
+
 async def handle_check_compatibility(update: Update, context, params):
     user_id = update.effective_user.id
     model1 = params.get("model1")
@@ -268,14 +373,14 @@ async def handle_check_compatibility(update: Update, context, params):
     message = (
         f"🛡️ *{escape_markdown_v2(f'{p1[0]} {p1[1]}')}* guard {'fits' if fit else 'does NOT fit'} *{escape_markdown_v2(f'{p2[0]} {p2[1]}')}*\n"
         f"Sizes: {p1[2]}×{p1[3]} mm, {p1[4]} in, Notch: {escape_markdown_v2(p1[5])} vs {p2[2]}×{p2[3]} mm, {p2[4]} in, Notch: {escape_markdown_v2(p2[5])}\n\n"
-        f"⚠️ *Note*: Dimensions-based precision may vary. Pro plan users get access to a verified compatible devices list for higher accuracy"
+        f"{NOTE_FREE}"
     )
     await send_markdown_v2(update, message)
 
-async def handle_list_compatible(update: Update, context, params):
+async def handle_list_compatible(update: Update, context, params, plan_id="free"):
     user_id = update.effective_user.id
     model = params.get("model")
-    is_pro = get_user_subscription_status(user_id) == "pro"
+    is_pro = plan_id == "pro"
 
     if not model:
         await send_markdown_v2(update, "❌ Please specify a model, e.g., 'Galaxy S21'")
@@ -290,19 +395,12 @@ async def handle_list_compatible(update: Update, context, params):
     if not arr:
         await send_markdown_v2(
             update,
-            f"⚠️ No compatible devices found for “{escape_markdown_v2(corr)}”\n\n"
-            f"⚠️ *Note*: Verified devices are admin-confirmed with exact matches. Dimension-based results use ±{TOL_MM}mm tolerance and may vary"
+            f"⚠️ No compatible devices found for “{escape_markdown_v2(corr)}”\n\n" + NOTE_NO_MATCHES
         )
         return
 
-    note = (
-        "✅ *Verified* devices are admin-confirmed with exact matches. "
-        "*Dimension-based* results use ±{TOL_MM}mm tolerance and may vary"
-    ) if is_pro else (
-        "⚠️ *Note*: Dimensions-based precision may vary. "
-        "Pro plan users get access to a verified compatible devices list for higher accuracy"
-    )
-    await send_markdown_v2(update, format_compatible_devices(arr) + "\n\n" + note)
+    note = NOTE_PRO if is_pro else NOTE_FREE
+    await send_markdown_v2(update, await format_devices(arr) + "\n\n" + note)
 
 async def handle_find_by_dimensions(update: Update, context, params):
     user_id = update.effective_user.id
@@ -317,20 +415,20 @@ async def handle_find_by_dimensions(update: Update, context, params):
         await send_markdown_v2(update, "❌ Please specify dimension ranges, e.g., 'height 150-155, width 70-75, diagonal 6.0-6.2'")
         return
 
-    arr = find_devices_by_dimensions(height_min, height_max, width_min, width_max, diagonal_min, diagonal_max)
-    if not arr:
+    formatted_arr = [
+        (*row, 'Dimension-based')
+        for row in find_devices_by_dimensions(height_min, height_max, width_min, width_max, diagonal_min, diagonal_max)
+    ]
+    if not formatted_arr:
         await send_markdown_v2(
             update,
-            "⚠️ No devices found in this range\n\n"
-            f"⚠️ *Note*: Dimensions-based precision may vary. Pro plan users get access to a verified compatible devices list for higher accuracy"
+            "⚠️ No devices found in this range\n\n" + NOTE_FREE
         )
         return
 
-    formatted_arr = [(b, m, h, w, d, nt, 'Dimension-based') for b, m, h, w, d, nt in arr]
     await send_markdown_v2(
         update,
-        format_compatible_devices(formatted_arr) + "\n\n"
-        f"⚠️ *Note*: Dimensions-based precision may vary. Pro plan users get access to a verified compatible devices list for higher accuracy"
+        await format_devices(formatted_arr) + "\n\n" + NOTE_FREE
     )
 
 async def handle_batch_compatibility(update: Update, context, params):
@@ -344,8 +442,7 @@ async def handle_batch_compatibility(update: Update, context, params):
     if not results:
         await send_markdown_v2(
             update,
-            "❌ No valid devices found\n\n"
-            f"⚠️ *Note*: Dimensions-based precision may vary. Pro plan users get access to a verified compatible devices list for higher accuracy"
+            "❌ No valid devices found\n\n" + NOTE_FREE
         )
         return
 
@@ -354,8 +451,7 @@ async def handle_batch_compatibility(update: Update, context, params):
         for (b1, m1), (b2, m2), fit in results
     ]
     message = (
-        "\n".join(lines) + "\n\n"
-        f"⚠️ *Note*: Dimensions-based precision may vary. Pro plan users get access to a verified compatible devices list for higher accuracy"
+        "\n".join(lines) + "\n\n" + NOTE_FREE
     )
     await send_markdown_v2(update, message)
 
@@ -375,37 +471,65 @@ async def handle_suggest_device(update: Update, context, params):
     try:
         add_device_suggestion(user_id, brand, model, height_mm, width_mm, diagonal_in, notch_type)
         await send_markdown_v2(update, "✅ Suggestion submitted for review")
-        for admin in ADMIN_IDS:
-            message = (
-                f"🔔 New suggestion: {escape_markdown_v2(brand)} {escape_markdown_v2(model)} "
-                f"({height_mm}×{width_mm} mm, {diagonal_in} in, Notch: {escape_markdown_v2(notch_type)})"
-            )
-            await context.bot.send_message(
-                admin,
-                message,
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
+        message = (
+            f"🔔 New suggestion: {escape_markdown_v2(brand)} {escape_markdown_v2(model)} "
+            f"({height_mm}×{width_mm} mm, {diagonal_in} in, Notch: {escape_markdown_v2(notch_type)})"
+        )
+        await send_to_admins(lambda admin: context.bot.send_message(
+            admin,
+            message,
+            parse_mode=ParseMode.MARKDOWN_V2
+        ))
     except Exception as e:
         await notify_admins(context, f"Error processing device suggestion: {e}", user_id)
         await send_markdown_v2(update, "❌ Failed to submit suggestion. Please try again.")
 
+def read_payment_qr():
+    with open(PAYMENT_QR_FILE, 'rb') as photo:
+        return photo.read()
+
+async def send_payment_qr(update, context, **kwargs):
+    # Telegram keeps uploaded photos; resend by file_id instead of re-uploading the bytes
+    file_id = context.application.bot_data.get("qr_file_id")
+    if file_id:
+        try:
+            return await update.message.reply_photo(photo=file_id, **kwargs)
+        except BadRequest as e:
+            # Caption and other errors are the caller's; only a stale file_id means re-upload
+            if "file identifier" not in e.message.lower():
+                raise
+            logging.error(f"Cached QR code file_id rejected, uploading again: {e}")
+            context.application.bot_data.pop("qr_file_id", None)
+    photo = await asyncio.to_thread(read_payment_qr)
+    msg = await update.message.reply_photo(photo=photo, **kwargs)
+    context.application.bot_data["qr_file_id"] = msg.photo[-1].file_id
+    return msg
+
+@functools.lru_cache(maxsize=1)
+def get_plan_catalog():
+    # Plans are seeded from config at startup and never change while running,
+    # so the escaped listing is rendered once alongside the lookup index
+    plans = tuple(get_plans())
+    listing = "\n\n".join(
+        f"{i+1}\\. *{escape_markdown_v2(pid)}* – ₹{escape_markdown_v2(f'{price:g}')}\n"
+        f"{escape_markdown_v2(desc)}"
+        for i, (pid, price, desc) in enumerate(plans)
+    )
+    return plans, {pid.lower(): i for i, (pid, _, _) in enumerate(plans)}, listing
+
 async def handle_buy_subscription(update: Update, context, parameters):
     user_id = update.effective_user.id
     plan_id = parameters.get("plan_id")
 
-    plans = get_plans()
+    plans, plan_index, listing = get_plan_catalog()
     if not plans:
         await send_markdown_v2(update, "❌ No plans available")
         return
 
     if not plan_id:
-        lines = [
-            f"{i+1}. *{escape_markdown_v2(pid)}* – ₹{price}\n{escape_markdown_v2(desc)}"
-            for i, (pid, price, desc) in enumerate(plans)
-        ]
         context.user_data["plans_list"] = plans
         message = (
-            "📋 *Available Plans*:\n\n" + "\n\n".join(lines) +
+            "📋 *Available Plans*:\n\n" + listing +
             "\n\nPlease specify the plan number or ID, e.g., 'Buy plan 1' or 'Buy Pro plan'"
         )
         await send_markdown_v2(update, message)
@@ -417,33 +541,24 @@ async def handle_buy_subscription(update: Update, context, parameters):
         if 0 <= i < len(plans):
             idx = i
     else:
-        for i, (pid, _, _) in enumerate(plans):
-            if plan_id.lower() == pid.lower():
-                idx = i
-                break
+        idx = plan_index.get(plan_id.lower())
 
     if idx is None:
         await send_markdown_v2(update, "❌ Invalid plan. Please specify the plan number or ID")
         return
 
     pid, price, _ = plans[idx]
-    context.user_data["buy_plan_id"] = pid
-    context.user_data["state"] = "awaiting_payment_screenshot"
+    context.user_data["flow"] = (AWAITING_PAYMENT, pid)
 
-    # Format caption and escape the entire string
+    # Build the caption from already-escaped pieces so the bold plan id survives
     caption = (
-        f"Please pay ₹{price} via UPI to {escape_markdown_v2(PAYMENT_UPI_ID)} for the *{escape_markdown_v2(pid)}* plan.\n"
+        f"Please pay ₹{escape_markdown_v2(f'{price:g}')} via UPI to {escape_markdown_v2(PAYMENT_UPI_ID)} "
+        f"for the *{escape_markdown_v2(pid)}* plan\\.\n"
         "Or scan the QR code below:"
     )
-    caption = escape_markdown_v2(caption)  # Escape the entire caption
     logging.info(f"Attempting to send QR code with caption: {caption}")
     try:
-        with open(PAYMENT_QR_FILE, 'rb') as photo:
-            await update.message.reply_photo(
-                photo=photo,
-                caption=caption,
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
+        await send_payment_qr(update, context, caption=caption, parse_mode=ParseMode.MARKDOWN_V2)
         await send_markdown_v2(update, "After paying, send a screenshot of the payment or type /cancel to exit")
     except FileNotFoundError as e:
         logging.error(f"QR code file not found: {PAYMENT_QR_FILE}")
@@ -453,11 +568,11 @@ async def handle_buy_subscription(update: Update, context, parameters):
         logging.error(f"Failed to send photo message: {e}")
         # Fallback to plain text caption
         try:
-            with open(PAYMENT_QR_FILE, 'rb') as photo:
-                await update.message.reply_photo(
-                    photo=photo,
-                    caption=f"Please pay ₹{price} via UPI to {PAYMENT_UPI_ID} for the {pid} plan.\nOr scan the QR code below:"
-                )
+            await send_payment_qr(
+                update,
+                context,
+                caption=f"Please pay ₹{price:g} via UPI to {PAYMENT_UPI_ID} for the {pid} plan.\nOr scan the QR code below:"
+            )
             await send_markdown_v2(update, "After paying, send a screenshot of the payment or type /cancel to exit")
         except Exception as fallback_e:
             logging.error(f"Fallback failed: {fallback_e}")
@@ -468,7 +583,7 @@ async def handle_buy_subscription(update: Update, context, parameters):
         await send_markdown_v2(update, "❌ An unexpected error occurred. Please try again or contact support.")
         await notify_admins(context, f"Unexpected error sending QR code: {e}", user_id)
 
-async def handle_view_subscription(update: Update, context):
+async def handle_view_subscription(update: Update, context, params=None):
     user_id = update.effective_user.id
     details = get_subscription_details(user_id)
     message = (
@@ -488,8 +603,8 @@ async def process_payment_screenshot(update: Update, context):
         return
 
     file_id = photos[-1].file_id
-    plan_id = context.user_data.pop("buy_plan_id", None)
-    context.user_data.pop("state", None)
+    flow = context.user_data.pop("flow", FLOW_IDLE)
+    plan_id = flow[1] if flow[:1] == (AWAITING_PAYMENT,) else None
 
     if not plan_id:
         await send_markdown_v2(update, "⚠️ No plan selected. Please start the payment process again")
@@ -498,23 +613,19 @@ async def process_payment_screenshot(update: Update, context):
     try:
         pid = add_payment(user_id, plan_id, file_id)
         await send_markdown_v2(update, "✅ Payment received, pending approval")
-        for admin in ADMIN_IDS:
-            kb = InlineKeyboardMarkup([[
-                InlineKeyboardButton("✅ Approve", callback_data=f"approve_{pid}"),
-                InlineKeyboardButton("❌ Reject", callback_data=f"reject_{pid}")
-            ]])
-            caption = (
-                f"🔔 New payment \\#{pid}\n"
-                f"User: `{user_id}`\n"
-                f"Plan: *{escape_markdown_v2(plan_id)}*"
-            )
-            await context.bot.send_photo(
-                chat_id=admin,
-                photo=file_id,
-                caption=caption,
-                parse_mode=ParseMode.MARKDOWN_V2,
-                reply_markup=kb
-            )
+        kb = review_keyboard(pid)
+        caption = (
+            f"🔔 New payment \\#{pid}\n"
+            f"User: `{user_id}`\n"
+            f"Plan: *{escape_markdown_v2(plan_id)}*"
+        )
+        await send_to_admins(lambda admin: context.bot.send_photo(
+            chat_id=admin,
+            photo=file_id,
+            caption=caption,
+            parse_mode=ParseMode.MARKDOWN_V2,
+            reply_markup=kb
+        ))
     except Exception as e:
         logging.error(f"Error processing payment screenshot: {e}")
         await notify_admins(context, f"Error processing payment screenshot: {str(e)}", user_id)
@@ -600,12 +711,15 @@ async def handle_add_compatible_devices(update: Update, context, params):
         await send_markdown_v2(update, f"❌ Device {escape_markdown_v2(brand)} {escape_markdown_v2(model)} not found in the database")
         return
 
-    valid_devices = []
-    for compat_brand, compat_model in compatible_devices:
-        if device_exists(compat_brand, compat_model):
-            valid_devices.append((compat_brand, compat_model))
-        else:
-            await send_markdown_v2(update, f"⚠️ Compatible device {escape_markdown_v2(compat_brand)} {escape_markdown_v2(compat_model)} not found in the database. Skipping")
+    candidates = [(compat_brand, compat_model) for compat_brand, compat_model in compatible_devices]
+    found = existing_devices(candidates)
+    valid_devices = [device for device in candidates if device in found]
+    skipped = [
+        f"{escape_markdown_v2(compat_brand)} {escape_markdown_v2(compat_model)}"
+        for compat_brand, compat_model in candidates if (compat_brand, compat_model) not in found
+    ]
+    if skipped:
+        await send_markdown_v2(update, f"⚠️ Skipping compatible devices not found in the database: {', '.join(skipped)}")
 
     if not valid_devices:
         await send_markdown_v2(update, "❌ No valid compatible devices provided")
@@ -618,31 +732,26 @@ async def handle_add_compatible_devices(update: Update, context, params):
         await notify_admins(context, f"Error adding compatible devices: {e}", user_id)
         await send_markdown_v2(update, "❌ Failed to add compatible devices. Please try again.")
 
-async def handle_review_suggestions(update: Update, context):
+async def handle_review_suggestions(update: Update, context, params=None):
     user_id = update.effective_user.id
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
-            "SELECT id,brand,model,height_mm,width_mm,diagonal_in,notch_type FROM device_suggestions WHERE status='pending'"
-        ).fetchall()
+    rows = await asyncio.to_thread(list_pending_suggestions)
     if not rows:
         await send_markdown_v2(update, "⚠️ No pending suggestions")
         return
 
-    for rid, b, m, h, w, d, nt in rows:
-        kb = InlineKeyboardMarkup([[
-            InlineKeyboardButton("✅ Approve", callback_data=f"approve_sug_{rid}"),
-            InlineKeyboardButton("❌ Reject", callback_data=f"reject_sug_{rid}")
-        ]])
-        message = (
-            f"Suggestion #{rid}: {escape_markdown_v2(b)} {escape_markdown_v2(m)} "
-            f"({h}×{w} mm, {d} in, Notch: {escape_markdown_v2(nt)})"
-        )
-        await update.message.reply_text(
-            message,
+    await gather_bounded(
+        update.message.reply_text(
+            f"Suggestion \\#{rid}: {_emd(b)} {_emd(m)} "
+            f"\\({_emd(str(h))}×{_emd(str(w))} mm, {_emd(str(d))} in, Notch: {_emd(nt)}\\)",
             parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=kb
+            reply_markup=review_keyboard(f"sug_{rid}")
         )
-    await send_markdown_v2(update, "Select a suggestion to approve or reject")
+        for rid, b, m, h, w, d, nt in rows
+    )
+    await send_markdown_v2(
+        update, "Select a suggestion to approve or reject, or review them all at once",
+        bulk_review_keyboard(max(row[0] for row in rows))
+    )
 
 async def handle_fetch_device(update: Update, context, params):
     user_id = update.effective_user.id
@@ -663,7 +772,8 @@ async def handle_fetch_device(update: Update, context, params):
 async def payment_review_callback(update: Update, context):
     query = update.callback_query
     await query.answer()
-    action, sid = query.data.split("_", 1)
+    # Data is "<action>_<id>", already validated by REVIEW_CALLBACK_RE
+    action, _, sid = query.data.rpartition("_")
     pid = int(sid)
     rec = get_payment(pid)
     if not rec:
@@ -676,19 +786,7 @@ async def payment_review_callback(update: Update, context):
     _, uid, plan_id, _, _, _ = rec
     new_status = "approved" if action == "approve" else "rejected"
     try:
-        update_payment_status(pid, new_status)
-        caption = escape_markdown_v2(f"✅ Payment #{pid} *{new_status}*")
-        await query.edit_message_caption(
-            caption=caption,
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=None
-        )
-        message = f"Your payment for plan *{escape_markdown_v2(plan_id)}* has been *{escape_markdown_v2(new_status)}*"
-        await context.bot.send_message(
-            chat_id=uid,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN_V2
-        )
+        await asyncio.to_thread(update_payment_status, pid, new_status)
     except Exception as e:
         await notify_admins(context, f"Error reviewing payment: {e}", uid)
         await query.edit_message_caption(
@@ -696,80 +794,170 @@ async def payment_review_callback(update: Update, context):
             parse_mode=ParseMode.MARKDOWN_V2,
             reply_markup=None
         )
+        return
+
+    # The status is committed, so the admin edit and the user notice are independent
+    results = await asyncio.gather(
+        query.edit_message_caption(
+            caption=f"✅ Payment \\#{pid} *{_emd(new_status)}*",
+            parse_mode=ParseMode.MARKDOWN_V2,
+            reply_markup=None
+        ),
+        context.bot.send_message(
+            chat_id=uid,
+            text=f"Your payment for plan *{_emd(plan_id)}* has been *{_emd(new_status)}*",
+            parse_mode=ParseMode.MARKDOWN_V2
+        ),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            await notify_admins(context, f"Error reviewing payment #{pid}: {result}", uid)
 
 async def suggestion_review_callback(update: Update, context):
     query = update.callback_query
     await query.answer()
-    action, sid = query.data.split("_", 1)
-    rid = int(sid.split("_")[-1])
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT brand,model,height_mm,width_mm,diagonal_in,notch_type FROM device_suggestions WHERE id=?",
-            (rid,)
-        ).fetchone()
-        if not row:
-            await query.edit_message_text(
-                escape_markdown_v2("❌ Suggestion not found"),
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
-            return
-        b, m, h, w, d, nt = row
+    # Data is "<action>_sug_<id>", already validated by REVIEW_CALLBACK_RE
+    head, _, sid = query.data.rpartition("_")
+    action = head[:-4]
+    rid = int(sid)
+    try:
+        async with context.application.bot_data["write_lock"]:
+            status, row = await asyncio.to_thread(review_device_suggestion, rid, action == "approve")
+    except Exception as e:
+        await notify_admins(context, f"Error reviewing suggestion: {e}", update.effective_user.id)
+        await query.edit_message_text(
+            escape_markdown_v2("❌ Failed to process suggestion review"),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+        return
 
-        if action == "approve" and device_exists(b, m):
-            conn.execute(
-                "UPDATE device_suggestions SET status='rejected' WHERE id=?",
-                (rid,)
-            )
-            conn.commit()
-            await query.edit_message_text(
-                f"❌ Suggestion #{rid} rejected: {escape_markdown_v2(b)} {escape_markdown_v2(m)} already exists in the database",
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
-            return
+    if not status:
+        await query.edit_message_text(
+            escape_markdown_v2("❌ Suggestion not found or already reviewed"),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+        return
+    b, m = row[0], row[1]
+    if status == "duplicate":
+        await query.edit_message_text(
+            f"❌ Suggestion \\#{rid} rejected: {_emd(b)} {_emd(m)} already exists in the database",
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+        return
+    await query.edit_message_text(
+        escape_markdown_v2(f"✅ Suggestion #{rid} {status}"),
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
 
-        try:
-            if action == "approve":
-                add_phone(f"{b} {m}", h, w, d, nt)
-                conn.execute(
-                    "UPDATE device_suggestions SET status='approved' WHERE id=?",
-                    (rid,)
-                )
-            else:
-                conn.execute(
-                    "UPDATE device_suggestions SET status='rejected' WHERE id=?",
-                    (rid,)
-                )
-            conn.commit()
-            await query.edit_message_text(
-                escape_markdown_v2(f"✅ Suggestion #{rid} {action}d"),
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
-        except Exception as e:
-            await notify_admins(context, f"Error reviewing suggestion: {e}", update.effective_user.id)
-            await query.edit_message_text(
-                escape_markdown_v2("❌ Failed to process suggestion review"),
-                parse_mode=ParseMode.MARKDOWN_V2
-            )
+async def review_callback(update: Update, context):
+    if "_sug_" in update.callback_query.data:
+        await suggestion_review_callback(update, context)
+    else:
+        await payment_review_callback(update, context)
 
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def bulk_suggestion_review_callback(update: Update, context):
+    query = update.callback_query
+    await query.answer()
+    action, _, max_rid = query.data.rpartition("_")
+    approve = action == "bulk_approve_sug"
+    try:
+        async with context.application.bot_data["write_lock"]:
+            approved, rejected = await asyncio.to_thread(review_all_suggestions, approve, int(max_rid))
+    except Exception as e:
+        await notify_admins(context, f"Error bulk reviewing suggestions: {e}", update.effective_user.id)
+        await query.edit_message_text(
+            escape_markdown_v2("❌ Failed to process suggestion review"),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+        return
+
+    if not approved and not rejected:
+        text = "⚠️ No pending suggestions"
+    elif approve:
+        text = f"✅ Approved {approved} suggestion(s), rejected {rejected} duplicate or invalid"
+    else:
+        text = f"✅ Rejected {rejected} suggestion(s)"
+    await query.edit_message_text(escape_markdown_v2(text), parse_mode=ParseMode.MARKDOWN_V2)
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, params=None):
     user_id = update.effective_user.id
-    context.user_data.pop("state", None)
-    context.user_data.pop("buy_plan_id", None)
+    context.user_data.pop("flow", None)
     await send_markdown_v2(update, "👋 Action cancelled")
 
+# Intent dispatch tables; anything not in INTENT_HANDLERS gets the model's reply
+INTENT_HANDLERS = {
+    "start": start,
+    "check_compatibility": handle_check_compatibility,
+    "list_compatible": handle_list_compatible,
+    "view_compatible_devices": handle_list_compatible,
+    "find_by_dimensions": handle_find_by_dimensions,
+    "batch_compatibility": handle_batch_compatibility,
+    "suggest_device": handle_suggest_device,
+    "buy_subscription": handle_buy_subscription,
+    "view_subscription": handle_view_subscription,
+    "list_devices": handle_list_devices,
+    "add_device": handle_add_device,
+    "edit_device": handle_edit_device,
+    "add_compatible_devices": handle_add_compatible_devices,
+    "review_suggestions": handle_review_suggestions,
+    "fetch_device": handle_fetch_device,
+    "cancel": cancel,
+}
+ADMIN_INTENTS = frozenset({
+    "list_devices", "add_device", "edit_device",
+    "add_compatible_devices", "review_suggestions", "fetch_device"
+})
+PRO_INTENTS = frozenset({"find_by_dimensions", "batch_compatibility"})
+PLAN_INTENTS = frozenset({"list_compatible", "view_compatible_devices"})
+BILLABLE_INTENTS = frozenset({
+    "check_compatibility", "list_compatible", "find_by_dimensions",
+    "batch_compatibility", "view_compatible_devices"
+})
+
+async def post_init(application):
+    # Serializes suggestion review writes now that updates are handled concurrently
+    application.bot_data["write_lock"] = asyncio.Lock()
+
+async def post_shutdown(application):
+    await OPENAI_CLIENT.close()
+
 def main():
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     init_db()
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        # One long-lived HTTP/2 client multiplexes concurrent sends; getUpdates
+        # only ever has one request in flight, so it gets its own small client
+        .request(HTTPXRequest(
+            connection_pool_size=512, pool_timeout=30, read_timeout=30, http_version="2"
+        ))
+        .get_updates_request(HTTPXRequest(connection_pool_size=1, http_version="2"))
+        .concurrent_updates(256)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     app.add_error_handler(error_handler)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo_message))
-    app.add_handler(CallbackQueryHandler(payment_review_callback, pattern=r'^(approve|reject)_\d+$'))
-    app.add_handler(CallbackQueryHandler(suggestion_review_callback, pattern=r'^(approve_sug|reject_sug)_\d+$'))
+    app.add_handler(CallbackQueryHandler(review_callback, pattern=REVIEW_CALLBACK_RE))
+    app.add_handler(CallbackQueryHandler(bulk_suggestion_review_callback, pattern=BULK_SUGGESTION_CALLBACK_RE))
     app.add_handler(CommandHandler("cancel", cancel))
 
-    app.run_polling()
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TELEGRAM_TOKEN}",
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,6 @@
 # config.py
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,11 +14,19 @@ if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is required")
 
 DB_PATH = os.getenv("DB_PATH", "glasses.db")
-ADMIN_IDS = set(int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.isdigit())
+# Negative ids are group/supergroup chats that admin notifications can go to
+ADMIN_IDS = frozenset(
+    int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if re.fullmatch(r"-?\d+", x)
+)
+ADMIN_IDS_TUPLE = tuple(sorted(ADMIN_IDS))
 PAYMENT_QR_FILE = os.getenv("PAYMENT_QR_FILE", "qr_code.jpg")  # Default to qr_code.jpg in project directory
 PAYMENT_UPI_ID = os.getenv("PAYMENT_UPI_ID", "your-upi@bank")
 TOL_MM = float(os.getenv("TOL_MM", 0.5))
 FUZZY_THRESHOLD = int(os.getenv("FUZZY_THRESHOLD", 70))
+# Public HTTPS URL Telegram pushes updates to; long polling is used when unset
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
 
 PLANS = {
     "free": (
@@ -1,22 +1,107 @@
 # services.py
 import sqlite3
-from fuzzywuzzy import process
+from rapidfuzz import process, fuzz, utils
 from datetime import datetime, timedelta
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+from bisect import bisect_left, bisect_right
 from config import DB_PATH, TOL_MM, FUZZY_THRESHOLD, PLANS
 from tenacity import retry, stop_after_attempt, wait_fixed
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+import threading
 import logging
+import orjson
+import functools
+import sys
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO)
 
 _display_list_cache = None
-VALID_NOTCH_TYPES = {"None", "Punch-hole", "Waterdrop", "Notch", "Full"}
+# Display names run through the fuzzy matcher's preprocessing, same order as the list
+_display_names_processed = None
+# Display name -> spec; the first row wins when two devices share a display name
+_display_dict_cache = None
+# Lowercased, whitespace-collapsed display name -> display name, for exact-ish hits
+_display_norm_cache = None
+# Distinct brands and their preprocessed forms, in matching order
+_brand_list_cache = None
+_brand_names_processed = None
+# Canonical "brand model" keys of every device, rebuilt with the display list
+_device_keys = None
+# Device lookups only change on admin edits, which clear these explicitly
+_lookup_lock = threading.Lock()
+_device_exists_cache = TTLCache(maxsize=10_000, ttl=300)
+_phone_cache = TTLCache(maxsize=10_000, ttl=300)
+# Payment rows are evicted by update_payment_status when their status changes
+_payment_cache = TTLCache(maxsize=1024, ttl=300)
+VALID_NOTCH_TYPES = frozenset(sys.intern(t) for t in ("None", "Punch-hole", "Waterdrop", "Notch", "Full"))
+# Case-insensitive fallback; str.title() would turn "punch-hole" into "Punch-Hole"
+_NOTCH_TYPES_BY_LOWER = {t.lower(): t for t in VALID_NOTCH_TYPES}
+# Bump when init_db's DDL changes so existing databases pick it up
+SCHEMA_VERSION = 2
+# Per-connection settings; journal_mode=WAL is persistent and set once in init_db
+_CONNECTION_PRAGMAS = (
+    "synchronous=NORMAL",
+    "cache_size=-64000",
+    "mmap_size=268435456",
+    "temp_store=MEMORY",
+)
+# One long-lived write connection; the re-entrant lock lets helpers call each
+# other while only the outermost block commits or rolls back
+_db_lock = threading.RLock()
+_db_conn = None
+_db_depth = 0
+# Thread currently inside a write block, so its own reads see its changes
+_db_owner = None
+# Readers get a query-only connection per thread and never take the lock;
+# under WAL they run alongside the writer instead of queueing behind it
+_read_local = threading.local()
+
+def _connect(**kwargs):
+    conn = sqlite3.connect(DB_PATH, **kwargs)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    return conn
+
+@contextmanager
+def _db():
+    global _db_conn, _db_depth, _db_owner
+    with _db_lock:
+        if _db_conn is None:
+            _db_conn = _connect(check_same_thread=False)
+        _db_depth += 1
+        _db_owner = threading.get_ident()
+        try:
+            if _db_depth > 1:
+                yield _db_conn
+            else:
+                with _db_conn:
+                    yield _db_conn
+        finally:
+            _db_depth -= 1
+            if not _db_depth:
+                _db_owner = None
+
+@contextmanager
+def _read_db():
+    if _db_owner == threading.get_ident():
+        with _db() as conn:
+            yield conn
+        return
+    conn = getattr(_read_local, "conn", None)
+    if conn is None:
+        conn = _read_local.conn = _connect()
+        conn.execute("PRAGMA query_only=ON")
+    yield conn
 
 def normalize_notch_type(notch_type: str) -> str:
-    notch_type = notch_type.strip().title()
-    return notch_type if notch_type in VALID_NOTCH_TYPES else "None"
+    if notch_type in VALID_NOTCH_TYPES:
+        return notch_type
+    return _NOTCH_TYPES_BY_LOWER.get(notch_type.strip().lower(), "None")
 
 def validate_device_dimensions(height_mm: float, width_mm: float, diagonal_in: float) -> bool:
     return (
@@ -26,99 +111,123 @@ def validate_device_dimensions(height_mm: float, width_mm: float, diagonal_in: f
     )
 
 def clear_display_list_cache():
-    global _display_list_cache
+    # The name index and brand lists are rebuilt along with the display list
+    global _display_list_cache, _device_keys
     _display_list_cache = None
+    normalize_glass.cache_clear()
+    _device_keys = None
+    with _lookup_lock:
+        _device_exists_cache.clear()
+        _phone_cache.clear()
 
 def _build_display_list():
-    global _display_list_cache
+    global _display_list_cache, _display_names_processed, _display_dict_cache
+    global _display_norm_cache, _brand_list_cache, _brand_names_processed
     if _display_list_cache is None:
-        with sqlite3.connect(DB_PATH) as conn:
+        with _read_db() as conn:
             rows = conn.execute(
                 "SELECT brand,model,height_mm,width_mm,diagonal_in,notch_type FROM glasses"
             ).fetchall()
-        _display_list_cache = [
+        display_list = [
             (f"{b} {m}".strip(), (b, m, h, w, d, nt))
             for b, m, h, w, d, nt in rows
         ]
+        _display_names_processed = [utils.default_process(d) for d, _ in display_list]
+        _display_dict_cache = {}
+        _display_norm_cache = {}
+        for display, spec in display_list:
+            _display_dict_cache.setdefault(display, spec)
+            _display_norm_cache.setdefault(" ".join(display.lower().split()), display)
+        _brand_list_cache = tuple(sorted({b for b, *_rest in rows}))
+        _brand_names_processed = [utils.default_process(b) for b in _brand_list_cache]
+        _display_list_cache = display_list
     return _display_list_cache
 
+def device_key(brand, model):
+    # Case, spacing and the brand/model split don't make a device distinct
+    return " ".join(f"{brand} {model}".lower().split())
+
+def _known_device_keys():
+    global _device_keys
+    if _device_keys is None:
+        _device_keys = {device_key(b, m) for _, (b, m, *_rest) in _build_display_list()}
+    return _device_keys
+
+# Full schema, applied in one script whenever SCHEMA_VERSION is ahead of the database.
+# Lookups by brand and by source device are already served by the primary keys
+_SCHEMA_DDL = """
+CREATE TABLE IF NOT EXISTS glasses (
+    brand       TEXT,
+    model       TEXT,
+    height_mm   REAL,
+    width_mm    REAL,
+    diagonal_in REAL,
+    notch_type  TEXT,
+    PRIMARY KEY(brand, model)
+);
+CREATE TABLE IF NOT EXISTS device_suggestions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     INTEGER,
+    brand       TEXT,
+    model       TEXT,
+    height_mm   REAL,
+    width_mm    REAL,
+    diagonal_in REAL,
+    notch_type  TEXT,
+    status      TEXT DEFAULT 'pending',
+    created_at  TEXT
+);
+CREATE TABLE IF NOT EXISTS subscription_plans (
+    plan_id     TEXT PRIMARY KEY,
+    price       REAL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id             INTEGER,
+    plan_id             TEXT,
+    screenshot_file_id  TEXT,
+    status              TEXT,
+    created_at          TEXT,
+    FOREIGN KEY(plan_id) REFERENCES subscription_plans(plan_id)
+);
+CREATE TABLE IF NOT EXISTS compatible_devices (
+    device_brand      TEXT,
+    device_model      TEXT,
+    compatible_brand  TEXT,
+    compatible_model  TEXT,
+    PRIMARY KEY(device_brand, device_model, compatible_brand, compatible_model),
+    FOREIGN KEY(device_brand, device_model) REFERENCES glasses(brand, model)
+);
+CREATE TABLE IF NOT EXISTS user_queries (
+    user_id     INTEGER,
+    query_date  TEXT,
+    query_count INTEGER,
+    PRIMARY KEY(user_id, query_date)
+);
+CREATE INDEX IF NOT EXISTS idx_glasses_dims
+    ON glasses(height_mm, width_mm, diagonal_in, notch_type);
+CREATE INDEX IF NOT EXISTS idx_payments_user_status
+    ON payments(user_id, status, created_at DESC);
+"""
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS glasses (
-                brand       TEXT,
-                model       TEXT,
-                height_mm   REAL,
-                width_mm    REAL,
-                diagonal_in REAL,
-                notch_type  TEXT,
-                PRIMARY KEY(brand, model)
-            )
-        """)
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS device_suggestions (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id     INTEGER,
-                brand       TEXT,
-                model       TEXT,
-                height_mm   REAL,
-                width_mm    REAL,
-                diagonal_in REAL,
-                notch_type  TEXT,
-                status      TEXT DEFAULT 'pending',
-                created_at  TEXT
-            )
-        """)
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS subscription_plans (
-                plan_id     TEXT PRIMARY KEY,
-                price       REAL,
-                description TEXT
-            )
-        """)
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS payments (
-                id                  INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id             INTEGER,
-                plan_id             TEXT,
-                screenshot_file_id  TEXT,
-                status              TEXT,
-                created_at          TEXT,
-                FOREIGN KEY(plan_id) REFERENCES subscription_plans(plan_id)
+    with _db() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Restarts against an up-to-date database skip the DDL entirely
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(
+                f"BEGIN;{_SCHEMA_DDL}ANALYZE;\nPRAGMA user_version={SCHEMA_VERSION};\nCOMMIT;"
             )
-        """)
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS compatible_devices (
-                device_brand      TEXT,
-                device_model      TEXT,
-                compatible_brand  TEXT,
-                compatible_model  TEXT,
-                PRIMARY KEY(device_brand, device_model, compatible_brand, compatible_model),
-                FOREIGN KEY(device_brand, device_model) REFERENCES glasses(brand, model)
-            )
-        """)
-        conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS user_queries (
-                user_id     INTEGER,
-                query_date  TEXT,
-                query_count INTEGER,
-                PRIMARY KEY(user_id, query_date)
-            )
-        """)
-        conn.commit()
 
-        existing = conn.execute("SELECT plan_id FROM subscription_plans").fetchall()
-        have = {r[0] for r in existing}
-        for pid, (price, desc) in PLANS.items():
-            if pid not in have:
-                conn.execute(
-                    "INSERT INTO subscription_plans (plan_id,price,description) VALUES (?,?,?)",
-                    (pid, price, desc)
-                )
+        conn.executemany(
+            "INSERT OR IGNORE INTO subscription_plans (plan_id,price,description) VALUES (?,?,?)",
+            [(pid, price, desc) for pid, (price, desc) in PLANS.items()]
+        )
         conn.commit()
 
 def get_plans():
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             "SELECT plan_id,price,description FROM subscription_plans"
         ).fetchall()
@@ -126,7 +235,7 @@ def get_plans():
 
 def add_payment(user_id, plan_id, screenshot_file_id):
     now = datetime.utcnow().isoformat()
-    with sqlite3.connect(DB_PATH) as conn:
+    with _db() as conn:
         cur = conn.execute(
             "INSERT INTO payments (user_id,plan_id,screenshot_file_id,status,created_at) "
             "VALUES (?,?,?,?,?)",
@@ -134,10 +243,13 @@ def add_payment(user_id, plan_id, screenshot_file_id):
         )
         pid = cur.lastrowid
         conn.commit()
+    with _lookup_lock:
+        _payment_cache.pop(hashkey(pid), None)
     return pid
 
+@cached(_payment_cache, lock=_lookup_lock)
 def get_payment(payment_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         row = conn.execute(
             "SELECT id,user_id,plan_id,screenshot_file_id,status,created_at "
             "FROM payments WHERE id=?",
@@ -146,7 +258,7 @@ def get_payment(payment_id):
     return row
 
 def list_payments(status="pending"):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             "SELECT id,user_id,plan_id,screenshot_file_id,status,created_at "
             "FROM payments WHERE status=?",
@@ -155,23 +267,24 @@ def list_payments(status="pending"):
     return rows
 
 def update_payment_status(payment_id, new_status):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _db() as conn:
         conn.execute(
             "UPDATE payments SET status=? WHERE id=?",
             (new_status, payment_id)
         )
         conn.commit()
+    with _lookup_lock:
+        _payment_cache.pop(hashkey(payment_id), None)
 
-def get_user_subscription_status(user_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT plan_id FROM payments WHERE user_id=? AND status='approved' ORDER BY created_at DESC LIMIT 1",
-            (user_id,)
-        ).fetchone()
-    return row[0] if row else "free"
+def _format_utc(dt):
+    # Same output as strftime("%Y-%m-%d %H:%M:%S UTC") without the format parsing
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} UTC"
+
+def _utc_today():
+    return datetime.utcnow().date().isoformat()
 
 def get_subscription_details(user_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         row = conn.execute(
             "SELECT plan_id, created_at FROM payments WHERE user_id=? AND status='approved' ORDER BY created_at DESC LIMIT 1",
             (user_id,)
@@ -180,60 +293,69 @@ def get_subscription_details(user_id):
         current_dt = datetime.utcnow()
         return {
             "plan_id": "free",
-            "created_at": current_dt.strftime("%Y-%m-%d %H:%M:%S UTC"),
+            "created_at": _format_utc(current_dt),
             "valid_till": "Indefinite"
         }
     plan_id, created_at = row
-    created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    # created_at is always written by datetime.utcnow().isoformat(), never with a 'Z'
+    created_dt = datetime.fromisoformat(created_at)
     expiry_dt = created_dt + timedelta(days=30)
     return {
         "plan_id": plan_id,
-        "created_at": created_dt.strftime("%Y-%m-%d %H:%M:%S UTC"),
-        "valid_till": expiry_dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+        "created_at": _format_utc(created_dt),
+        "valid_till": _format_utc(expiry_dt)
     }
 
-def increment_query_count(user_id):
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    with sqlite3.connect(DB_PATH) as conn:
+def get_user_quota(user_id):
+    today = _utc_today()
+    with _read_db() as conn:
         row = conn.execute(
-            "SELECT query_count FROM user_queries WHERE user_id=? AND query_date=?",
-            (user_id, today)
+            "SELECT "
+            "(SELECT plan_id FROM payments WHERE user_id=? AND status='approved' ORDER BY created_at DESC LIMIT 1), "
+            "(SELECT query_count FROM user_queries WHERE user_id=? AND query_date=?)",
+            (user_id, user_id, today)
         ).fetchone()
-        if row:
-            new_count = row[0] + 1
-            conn.execute(
-                "UPDATE user_queries SET query_count=? WHERE user_id=? AND query_date=?",
-                (new_count, user_id, today)
-            )
-        else:
-            conn.execute(
-                "INSERT INTO user_queries (user_id, query_date, query_count) VALUES (?,?,?)",
-                (user_id, today, 1)
-            )
-        conn.commit()
-    return row[0] + 1 if row else 1
+    return row[0] or "free", row[1] or 0
 
-def check_query_limit(user_id):
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    with sqlite3.connect(DB_PATH) as conn:
+def touch_user(user_id):
+    today = _utc_today()
+    with _db() as conn:
         row = conn.execute(
-            "SELECT query_count FROM user_queries WHERE user_id=? AND query_date=?",
+            "INSERT INTO user_queries (user_id, query_date, query_count) VALUES (?,?,1) "
+            "ON CONFLICT(user_id, query_date) DO UPDATE SET query_count = query_count + 1 "
+            "RETURNING (SELECT plan_id FROM payments WHERE payments.user_id=user_queries.user_id "
+            "AND status='approved' ORDER BY created_at DESC LIMIT 1), query_count",
             (user_id, today)
-        ).fetchone()
-    return row[0] if row else 0
+        ).fetchall()[0]
+        conn.commit()
+    return row[0] or "free", row[1]
 
+@cached(_device_exists_cache, lock=_lookup_lock)
 def device_exists(brand: str, model: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         row = conn.execute(
             "SELECT 1 FROM glasses WHERE brand=? AND model=?",
             (brand, model)
         ).fetchone()
     return bool(row)
 
+def existing_devices(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return set()
+    with _read_db() as conn:
+        rows = conn.execute(
+            "SELECT brand, model FROM glasses WHERE (brand, model) IN (VALUES {})".format(
+                ','.join('(?,?)' for _ in pairs)
+            ),
+            [v for pair in pairs for v in pair]
+        ).fetchall()
+    return set(rows)
+
 def add_glass(brand: str, model: str, h: float, w: float, diagonal_in: float, notch_type: str):
     if not validate_device_dimensions(h, w, diagonal_in):
         raise ValueError("Invalid device dimensions")
-    with sqlite3.connect(DB_PATH) as conn:
+    with _db() as conn:
         conn.execute(
             "INSERT OR REPLACE INTO glasses (brand,model,height_mm,width_mm,diagonal_in,notch_type) VALUES (?,?,?,?,?,?)",
             (brand, model, h, w, diagonal_in, normalize_notch_type(notch_type))
@@ -250,7 +372,7 @@ def add_device_suggestion(user_id, brand, model, h, w, diagonal_in, notch_type):
     if not validate_device_dimensions(h, w, diagonal_in):
         raise ValueError("Invalid device dimensions")
     now = datetime.utcnow().isoformat()
-    with sqlite3.connect(DB_PATH) as conn:
+    with _db() as conn:
         conn.execute(
             "INSERT INTO device_suggestions (user_id,brand,model,height_mm,width_mm,diagonal_in,notch_type,status,created_at) "
             "VALUES (?,?,?,?,?,?,?,?,?)",
@@ -258,47 +380,125 @@ def add_device_suggestion(user_id, brand, model, h, w, diagonal_in, notch_type):
         )
         conn.commit()
 
-def add_compatible_devices(device_brand: str, device_model: str, compatible_devices: list):
-    with sqlite3.connect(DB_PATH) as conn:
-        for compat_brand, compat_model in compatible_devices:
+def list_pending_suggestions():
+    with _read_db() as conn:
+        rows = conn.execute(
+            "SELECT id,brand,model,height_mm,width_mm,diagonal_in,notch_type "
+            "FROM device_suggestions WHERE status='pending'"
+        ).fetchall()
+    return rows
+
+def review_device_suggestion(suggestion_id, approve):
+    # Claims the pending row and applies the decision in one transaction;
+    # returns (None, None) when the suggestion is missing or already reviewed
+    new_status = "approved" if approve else "rejected"
+    with _db() as conn:
+        # Take the write lock up front rather than upgrading mid-transaction
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "UPDATE device_suggestions SET status=? WHERE id=? AND status='pending' "
+            "RETURNING brand,model,height_mm,width_mm,diagonal_in,notch_type",
+            (new_status, suggestion_id)
+        ).fetchall()
+        if not rows:
+            return None, None
+        row = rows[0]
+        if approve:
+            b, m, h, w, d, nt = row
+            if device_key(b, m) in _known_device_keys():
+                conn.execute(
+                    "UPDATE device_suggestions SET status='rejected' WHERE id=?",
+                    (suggestion_id,)
+                )
+                conn.commit()
+                return "duplicate", row
+            if not validate_device_dimensions(h, w, d):
+                raise ValueError("Invalid device dimensions")
             conn.execute(
-                "INSERT OR IGNORE INTO compatible_devices (device_brand,device_model,compatible_brand,compatible_model) "
-                "VALUES (?,?,?,?)",
-                (device_brand, device_model, compat_brand, compat_model)
+                "INSERT INTO glasses (brand,model,height_mm,width_mm,diagonal_in,notch_type) VALUES (?,?,?,?,?,?)",
+                (b, m, h, w, d, normalize_notch_type(nt))
             )
         conn.commit()
+    if approve:
+        clear_display_list_cache()
+    return new_status, row
+
+def review_all_suggestions(approve, max_id):
+    # Applies one decision to the pending queue up to max_id in a single transaction;
+    # when approving, duplicates and invalid dimensions are rejected instead.
+    # Returns (approved_count, rejected_count)
+    new_status = "approved" if approve else "rejected"
+    with _db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "UPDATE device_suggestions SET status=? WHERE status='pending' AND id<=? "
+            "RETURNING id,brand,model,height_mm,width_mm,diagonal_in,notch_type",
+            (new_status, max_id)
+        ).fetchall()
+        if not approve or not rows:
+            return 0, len(rows)
+        seen = set(_known_device_keys())
+        inserts, rejected = [], []
+        for rid, b, m, h, w, d, nt in rows:
+            key = device_key(b, m)
+            if key in seen or not validate_device_dimensions(h, w, d):
+                rejected.append((rid,))
+                continue
+            seen.add(key)
+            inserts.append((b, m, h, w, d, normalize_notch_type(nt)))
+        conn.executemany(
+            "UPDATE device_suggestions SET status='rejected' WHERE id=?",
+            rejected
+        )
+        conn.executemany(
+            "INSERT INTO glasses (brand,model,height_mm,width_mm,diagonal_in,notch_type) VALUES (?,?,?,?,?,?)",
+            inserts
+        )
+    clear_display_list_cache()
+    return len(inserts), len(rejected)
+
+def add_compatible_devices(device_brand: str, device_model: str, compatible_devices: list):
+    with _db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR IGNORE INTO compatible_devices (device_brand,device_model,compatible_brand,compatible_model) "
+            "VALUES (?,?,?,?)",
+            [(device_brand, device_model, cb, cm) for cb, cm in compatible_devices]
+        )
+        conn.commit()
 
 def get_compatible_devices(brand: str, model: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             "SELECT compatible_brand, compatible_model FROM compatible_devices WHERE device_brand=? AND device_model=?",
             (brand, model)
         ).fetchall()
     return [(cb, cm) for cb, cm in rows]
 
+@functools.lru_cache(maxsize=4096)
 def normalize_glass(name: str):
     cands = _build_display_list()
-    names = [d[0] for d in cands]
-    if not names:
-        return None
-    res = process.extractOne(name, names)
-    if not res:
-        return None
-    match, score = res
-    return match if score >= FUZZY_THRESHOLD else None
+    if name in _display_dict_cache:
+        return name
+    alias = _display_norm_cache.get(" ".join(name.lower().split()))
+    if alias:
+        return alias
+    res = process.extractOne(
+        utils.default_process(name), _display_names_processed,
+        scorer=fuzz.WRatio, processor=None, score_cutoff=FUZZY_THRESHOLD
+    )
+    return cands[res[2]][0] if res else None
 
 def normalize_brand(name: str):
-    brands = {spec[0] for _, spec in _build_display_list()}
-    if not brands:
-        return None
-    res = process.extractOne(name, list(brands))
-    if not res:
-        return None
-    match, score = res
-    return match if score >= FUZZY_THRESHOLD else None
+    _build_display_list()
+    res = process.extractOne(
+        utils.default_process(name), _brand_names_processed,
+        scorer=fuzz.WRatio, processor=None, score_cutoff=FUZZY_THRESHOLD
+    )
+    return _brand_list_cache[res[2]] if res else None
 
 def get_verified_dimension_bounds(brand: str, model: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             """
             SELECT g.brand, g.model, g.height_mm, g.width_mm, g.diagonal_in, g.notch_type
@@ -316,43 +516,20 @@ def get_verified_dimension_bounds(brand: str, model: str):
     if not rows:
         return None, None, None
 
-    min_height = float('inf')
-    max_height = float('-inf')
-    min_width = float('inf')
-    max_width = float('-inf')
-    min_diagonal = float('inf')
-    max_diagonal = float('-inf')
-    notch_types = set()
-    largest_device = None
-    smallest_device = None
-    largest_area = float('-inf')
-    smallest_area = float('inf')
-
-    for row in rows:
-        b, m, h, w, d, nt = row
-        area = h * w
-        notch_types.add(nt)
-        min_height = min(min_height, h)
-        max_height = max(max_height, h)
-        min_width = min(min_width, w)
-        max_width = max(max_width, w)
-        min_diagonal = min(min_diagonal, d)
-        max_diagonal = max(max_diagonal, d)
-        if area > largest_area:
-            largest_area = area
-            largest_device = (b, m, h, w, d, nt)
-        if area < smallest_area:
-            smallest_area = area
-            smallest_device = (b, m, h, w, d, nt)
+    # Column-wise reductions; ties keep the first row, as the old loop did
+    _, _, heights, widths, diagonals, notches = zip(*rows)
+    areas = [h * w for h, w in zip(heights, widths)]
+    largest_device = rows[areas.index(max(areas))]
+    smallest_device = rows[areas.index(min(areas))]
 
     bounds = {
-        'min_height': min_height,
-        'max_height': max_height,
-        'min_width': min_width,
-        'max_width': max_width,
-        'min_diagonal': min_diagonal,
-        'max_diagonal': max_diagonal,
-        'notch_types': notch_types
+        'min_height': min(heights),
+        'max_height': max(heights),
+        'min_width': min(widths),
+        'max_width': max(widths),
+        'min_diagonal': min(diagonals),
+        'max_diagonal': max(diagonals),
+        'notch_types': set(notches)
     }
     return largest_device, smallest_device, bounds
 
@@ -365,32 +542,42 @@ def check_compat(guard_spec, device_spec, height_tol=TOL_MM, width_tol=TOL_MM, d
     diagonal_compatible = abs(dd - gd) <= diagonal_tol
     return height_compatible and width_compatible and diagonal_compatible and notch_compatible
 
+# Fixed statement text so the connection's statement cache always hits; the
+# notch types are bound as one JSON array since their count varies per device.
+# The area cap is applied in SQL too, so rows come back ready to use
+_BOUNDED_DIMENSION_QUERY = """
+    SELECT brand, model, height_mm, width_mm, diagonal_in, notch_type, 'Dimension-based'
+    FROM glasses
+    WHERE height_mm BETWEEN ? AND ?
+      AND width_mm BETWEEN ? AND ?
+      AND diagonal_in BETWEEN ? AND ?
+      AND height_mm * width_mm <= ?
+      AND notch_type IN (SELECT value FROM json_each(?))
+"""
+
 def find_compatible_glasses(name: str, height_tol=TOL_MM, width_tol=TOL_MM, diagonal_tol=0.1):
     display = normalize_glass(name)
     if not display:
         return None
-    _, base = next(filter(lambda x: x[0] == display, _build_display_list()))
+    base = _display_dict_cache[display]
     base_brand, base_model, base_h, base_w, base_d, base_nt = base
 
     largest_device, smallest_device, bounds = get_verified_dimension_bounds(base_brand, base_model)
-    verified_devices = get_compatible_devices(base_brand, base_model)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        verified_rows = []
-        for cb, cm in verified_devices:
-            row = conn.execute(
-                """
-                SELECT brand, model, height_mm, width_mm, diagonal_in, notch_type
-                FROM glasses WHERE brand = ? AND model = ?
-                """,
-                (cb, cm)
-            ).fetchone()
-            if row:
-                b, m, h, w, d, nt = row
-                guard_spec = (base_brand, base_model, base_h, base_w, base_d, base_nt)
-                device_spec = (b, m, h, w, d, nt)
-                if check_compat(guard_spec, device_spec, height_tol=0, width_tol=0, diagonal_tol=0):
-                    verified_rows.append(row + ('Verified',))
+    with _read_db() as conn:
+        verified = conn.execute(
+            """
+            SELECT g.brand, g.model, g.height_mm, g.width_mm, g.diagonal_in, g.notch_type
+            FROM compatible_devices cd
+            JOIN glasses g ON cd.compatible_brand = g.brand AND cd.compatible_model = g.model
+            WHERE cd.device_brand = ? AND cd.device_model = ?
+            """,
+            (base_brand, base_model)
+        ).fetchall()
+        verified_rows = [
+            row + ('Verified',) for row in verified
+            if check_compat(base, row, height_tol=0, width_tol=0, diagonal_tol=0)
+        ]
 
         if not bounds:
             low_h, high_h = base_h - height_tol, base_h + height_tol
@@ -417,24 +604,11 @@ def find_compatible_glasses(name: str, height_tol=TOL_MM, width_tol=TOL_MM, diag
         max_d = bounds['max_diagonal'] + diagonal_tol
         valid_notch_types = bounds['notch_types'] | {'None'}
 
-        query = """
-            SELECT brand, model, height_mm, width_mm, diagonal_in, notch_type
-            FROM glasses
-            WHERE height_mm BETWEEN ? AND ?
-              AND width_mm BETWEEN ? AND ?
-              AND diagonal_in BETWEEN ? AND ?
-              AND notch_type IN ({})
-        """.format(','.join('?' * len(valid_notch_types)))
-        params = [min_h, max_h, min_w, max_w, min_d, max_d] + list(valid_notch_types)
-        rows = conn.execute(query, params).fetchall()
-
-        filtered_rows = []
-        base_area = base_h * base_w
-        for row in rows:
-            b, m, h, w, d, nt = row
-            area = h * w
-            if area <= base_area:
-                filtered_rows.append(row + ('Dimension-based',))
+        params = (
+            min_h, max_h, min_w, max_w, min_d, max_d, base_h * base_w,
+            orjson.dumps(list(valid_notch_types)).decode()
+        )
+        filtered_rows = conn.execute(_BOUNDED_DIMENSION_QUERY, params).fetchall()
 
         combined = verified_rows + filtered_rows
         unique_results = []
@@ -447,20 +621,18 @@ def find_compatible_glasses(name: str, height_tol=TOL_MM, width_tol=TOL_MM, diag
 
         return unique_results
 
+@cached(_phone_cache, lock=_lookup_lock)
 def get_phone(name: str):
     display = normalize_glass(name)
     if not display:
         return None
-    for disp, spec in _build_display_list():
-        if disp == display:
-            return spec
-    return None
+    return _display_dict_cache.get(display)
 
 def list_devices_by_brand(brand_name: str):
     norm = normalize_brand(brand_name)
     if not norm:
         return None
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             "SELECT model,height_mm,width_mm,diagonal_in,notch_type FROM glasses WHERE brand=?",
             (norm,)
@@ -470,7 +642,7 @@ def list_devices_by_brand(brand_name: str):
 def update_phone_dimensions(brand: str, model: str, h: float, w: float, diagonal_in: float, notch_type: str):
     if not validate_device_dimensions(h, w, diagonal_in):
         raise ValueError("Invalid device dimensions")
-    with sqlite3.connect(DB_PATH) as conn:
+    with _db() as conn:
         conn.execute(
             "UPDATE glasses SET height_mm=?, width_mm=?, diagonal_in=?, notch_type=? WHERE brand=? AND model=?",
             (h, w, diagonal_in, normalize_notch_type(notch_type), brand, model)
@@ -487,15 +659,24 @@ def check_batch_compatibility(device_names, height_tol=TOL_MM, width_tol=TOL_MM,
     specs = [spec for spec in device_cache.values() if spec]
     if len(specs) < 2:
         return []
+    # check_compat needs s1.h <= s2.h <= s1.h + height_tol, so only devices in that
+    # height window (found by bisecting the sorted heights) are checked in full;
+    # every other pair is reported as not compatible straight away
+    order = sorted(range(len(specs)), key=lambda k: specs[k][2])
+    heights = [specs[k][2] for k in order]
     results = []
     for i, s1 in enumerate(specs):
-        for s2 in specs[i+1:]:
-            fit = check_compat(s1, s2, height_tol, width_tol, diagonal_tol)
+        lo = bisect_left(heights, s1[2])
+        hi = bisect_right(heights, s1[2] + height_tol + 1e-9)
+        window = set(order[lo:hi])
+        for j in range(i + 1, len(specs)):
+            s2 = specs[j]
+            fit = j in window and check_compat(s1, s2, height_tol, width_tol, diagonal_tol)
             results.append(((s1[0], s1[1]), (s2[0], s2[1]), fit))
     return results
 
 def find_devices_by_dimensions(height_min: float, height_max: float, width_min: float, width_max: float, diagonal_min: float, diagonal_max: float):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read_db() as conn:
         rows = conn.execute(
             "SELECT brand,model,height_mm,width_mm,diagonal_in,notch_type FROM glasses "
             "WHERE height_mm BETWEEN ? AND ? AND width_mm BETWEEN ? AND ? AND diagonal_in BETWEEN ? AND ?",
@@ -503,13 +684,10 @@ def find_devices_by_dimensions(height_min: float, height_max: float, width_min:
         ).fetchall()
     return rows
 
+_MD2_TABLE = str.maketrans({c: f'\\{c}' for c in r'_[]()~`>#*+-|=}{.!'})
+
 def escape_markdown_v2(text):
-    logging.info(f"Escaping Markdown V2 text: {text}")
-    reserved_chars = r'_[]()~`>#*+-|=}{.!'
-    for char in reserved_chars:
-        text = text.replace(char, f'\\{char}')
-    logging.info(f"Escaped Markdown V2 text: {text}")
-    return text
+    return text.translate(_MD2_TABLE)
 
 def format_compatible_devices(devices):
     if not devices:
@@ -522,25 +700,36 @@ def format_compatible_devices(devices):
     ]
     return f"{header}\n{separator}\n" + "\n".join(rows)
 
+# Keep-alive session shared by the search and detail requests and their retries
+_GSM_SESSION = requests.Session()
+_GSM_SESSION.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"})
+_GSM_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+
+# GSMArena spec-table labels and value formats
+_RE_DIM = re.compile(r"Dimensions", re.I)
+_RE_SIZE = re.compile(r"Size", re.I)
+_RE_TYPE = re.compile(r"Type", re.I)
+_RE_DIM_VALS = re.compile(r"(\d+\.?\d*)\s*x\s*(\d+\.?\d*)\s*x\s*\d+\.?\d*")
+_RE_IN = re.compile(r"(\d+\.?\d*)\s*inches")
+
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
 def fetch_device_data_from_gsmarena(brand, model):
     try:
         query = f"{brand} {model}".replace(" ", "+")
         search_url = f"https://www.gsmarena.com/results.php3?sQuickSearch={query}"
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = _GSM_SESSION.get(search_url, timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = BeautifulSoup(response.text, "lxml")
 
-        device_list = soup.find("div", class_="makers")
-        if not device_list:
+        links = soup.select("div.makers a")
+        if not links:
             logging.error(f"No device list found on GSMArena for {brand} {model}")
             return None
 
         target_name = f"{brand} {model}".lower()
         device_url = None
-        for link in device_list.find_all("a"):
-            device_name = link.find("span").text.lower()
+        for link in links:
+            device_name = link.span.text.lower()
             if target_name in device_name or device_name in target_name:
                 device_url = "https://www.gsmarena.com" + link["href"]
                 break
@@ -559,22 +748,21 @@ def fetch_device_data_from_gsmarena(brand, model):
 
 def parse_device_page(url, brand, model):
     try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _GSM_SESSION.get(url, timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = BeautifulSoup(response.text, "lxml")
 
-        page_model = soup.find("h1", class_="specs-phone-name-title")
+        page_model = soup.select_one("h1.specs-phone-name-title")
         if not page_model:
             logging.error(f"No model name found on page {url}")
             return None
         page_model = page_model.text.strip().replace(f"{brand} ", "", 1)
 
         dimensions = None
-        body_section = soup.find("td", string=re.compile("Dimensions", re.I))
+        body_section = soup.find("td", string=_RE_DIM)
         if body_section:
             dimensions = body_section.find_next("td").text.strip()
-            match = re.match(r"(\d+\.?\d*)\s*x\s*(\d+\.?\d*)\s*x\s*\d+\.?\d*", dimensions)
+            match = _RE_DIM_VALS.match(dimensions)
             if match:
                 height_mm, width_mm = float(match.group(1)), float(match.group(2))
             else:
@@ -585,10 +773,10 @@ def parse_device_page(url, brand, model):
             return None
 
         diagonal_in = None
-        display_section = soup.find("td", string=re.compile("Size", re.I))
+        display_section = soup.find("td", string=_RE_SIZE)
         if display_section:
             display_text = display_section.find_next("td").text.strip()
-            match = re.match(r"(\d+\.?\d*)\s*inches", display_text)
+            match = _RE_IN.match(display_text)
             if match:
                 diagonal_in = float(match.group(1))
             else:
@@ -599,7 +787,7 @@ def parse_device_page(url, brand, model):
             return None
 
         notch_type = "None"
-        display_type = soup.find("td", string=re.compile("Type", re.I))
+        display_type = soup.find("td", string=_RE_TYPE)
         if display_type:
             display_type = display_type.find_next("td").text.lower()
             if "punch-hole" in display_type or "dynamic amoled" in display_type:
@@ -637,7 +825,7 @@ def update_device_from_source(brand, model):
     notch_type = device_data["notch_type"]
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with _db() as conn:
             if device_exists(brand, model):
                 cursor = conn.execute(
                     "SELECT height_mm, width_mm, diagonal_in, notch_type FROM glasses WHERE brand=? AND model=?",
@@ -659,6 +847,7 @@ def update_device_from_source(brand, model):
                         (height_mm, width_mm, diagonal_in, notch_type, brand, model)
                     )
                     conn.commit()
+                    clear_display_list_cache()
                     return "updated", f"Updated {brand} {model} ({height_mm}×{width_mm} mm, {diagonal_in} in, {notch_type})"
                 else:
                     return "skipped", f"Skipped {brand} {model} (no changes needed)"